@@ -2,20 +2,19 @@ import streamlit as st
 import streamlit.components.v1 as components
 import ifcopenshell
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
 from io import BytesIO
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER
-import json
+import orjson
 import tempfile
 import os
 import base64
+import secrets
+import weakref
+import xxhash
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import NamedTuple
 
 
 # ============================================
@@ -66,14 +65,91 @@ st.markdown("""
 # En producción Docker: usar la URL pública del servicio viewer
 VIEWER_URL = os.environ.get("IFC_VIEWER_URL", "http://localhost:3000")
 
+# Carpeta estática de Streamlit (server.enableStaticServing), servida en /app/static
+STATIC_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'models')
+# Streamlit no sirve archivos estáticos de más de 200 MB
+STATIC_SERVING_MAX_BYTES = 200 * 1024 * 1024
 
-def render_ifc_viewer(ifc_file_bytes: bytes, filename: str, height: int = 650):
+
+def remove_published_files(paths: set):
+    """Elimina del disco los modelos publicados indicados"""
+    for path in list(paths):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    paths.clear()
+
+
+class PublishedModels:
+    """
+    Modelos publicados por una sesión en la carpeta estática.
+    Vive en st.session_state: al terminar la sesión se recolecta y sus archivos se eliminan.
+    """
+
+    def __init__(self):
+        # Token aleatorio en el nombre: la URL no se puede deducir a partir del hash del archivo
+        self.token = secrets.token_urlsafe(16)
+        self.paths = set()
+        weakref.finalize(self, remove_published_files, self.paths)
+
+
+@st.cache_resource(show_spinner=False)
+def clear_stale_published_models():
+    """Una vez por proceso, antes de la primera publicación: elimina modelos de ejecuciones anteriores"""
+    if os.path.isdir(STATIC_MODELS_DIR):
+        remove_published_files({entry.path for entry in os.scandir(STATIC_MODELS_DIR) if entry.is_file()})
+
+
+def publish_model_file(ifc_file_bytes, digest: str):
+    """
+    Publica el IFC en la carpeta estática de Streamlit para que el visor lo descargue por URL.
+    Cada sesión conserva solo su modelo actual; los anteriores se eliminan al publicar otro.
+    Devuelve la ruta relativa del archivo, o None si no se puede servir de forma estática.
+    """
+    if not st.get_option('server.enableStaticServing') or len(ifc_file_bytes) > STATIC_SERVING_MAX_BYTES:
+        return None
+
+    clear_stale_published_models()
+    if 'published_models' not in st.session_state:
+        st.session_state['published_models'] = PublishedModels()
+    published = st.session_state['published_models']
+
+    os.makedirs(STATIC_MODELS_DIR, exist_ok=True)
+    file_name = f'{digest}-{published.token}.ifc'
+    model_path = os.path.join(STATIC_MODELS_DIR, file_name)
+
+    if not os.path.exists(model_path):
+        remove_published_files(published.paths)
+
+        # Escribir a un temporal y renombrar para que el visor nunca lea un archivo a medias
+        with tempfile.NamedTemporaryFile(dir=STATIC_MODELS_DIR, delete=False, suffix='.part') as tmp_file:
+            tmp_file.write(ifc_file_bytes)
+        os.replace(tmp_file.name, model_path)
+        published.paths.add(model_path)
+
+    return f'app/static/models/{file_name}'
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def encode_model_base64(digest: str, _ifc_file_bytes) -> str:
+    """
+    Codifica en base64 el IFC del modelo actual una sola vez, no en cada rerun del visor.
+    Se guarda como recurso: todos los reruns comparten la misma cadena en lugar de una copia.
+    """
+    return base64.b64encode(_ifc_file_bytes).decode('utf-8')
+
+
+def render_ifc_viewer(ifc_file_bytes, filename: str, digest: str, height: int = 650):
     """
     Renderiza el visor IFC usando el microservicio That Open Components.
-    El archivo IFC se pasa al visor mediante postMessage.
+    El visor descarga el IFC desde la carpeta estática de Streamlit; si el archivo no se
+    puede servir así (static serving desactivado o > 200 MB) se pasa mediante postMessage.
     """
-    # Codificar el archivo IFC en base64 para pasarlo al iframe
-    ifc_base64 = base64.b64encode(ifc_file_bytes).decode('utf-8')
+    model_path = publish_model_file(ifc_file_bytes, digest)
+
+    # Codificar el archivo IFC en base64 solo si no se puede pasar por URL
+    ifc_base64 = '' if model_path else encode_model_base64(digest, ifc_file_bytes)
 
     # HTML que contiene el iframe y el script para comunicarse con el visor
     html_content = f'''
@@ -137,30 +213,44 @@ def render_ifc_viewer(ifc_file_bytes: bytes, filename: str, height: int = 650):
             <div class="spinner"></div>
             <div id="status-text">Conectando con el visor...</div>
         </div>
-        <iframe id="viewer-frame" src="{VIEWER_URL}"></iframe>
+        <iframe id="viewer-frame"></iframe>
 
         <script>
             const iframe = document.getElementById('viewer-frame');
             const loadingOverlay = document.getElementById('loading-overlay');
             const statusText = document.getElementById('status-text');
 
+            const modelPath = "{model_path or ''}";
             const ifcData = "{ifc_base64}";
             const fileName = "{filename}";
 
             let viewerReady = false;
 
+            function base64ToArrayBuffer(base64) {{
+                const binaryString = atob(base64);
+                const bytes = new Uint8Array(binaryString.length);
+                for (let i = 0; i < binaryString.length; i++) {{
+                    bytes[i] = binaryString.charCodeAt(i);
+                }}
+                return bytes.buffer;
+            }}
+
             // Escuchar mensajes del visor
             window.addEventListener('message', (event) => {{
                 if (event.data.type === 'viewerReady') {{
                     viewerReady = true;
                     statusText.textContent = 'Cargando modelo IFC...';
 
-                    // Enviar el archivo IFC al visor
-                    iframe.contentWindow.postMessage({{
-                        type: 'loadIFC',
-                        data: ifcData,
-                        fileName: fileName
-                    }}, '*');
+                    // Sin URL estática: enviar el archivo IFC al visor.
+                    // El ArrayBuffer se transfiere (tercer argumento) en lugar de copiarse
+                    if (!modelPath) {{
+                        const buffer = base64ToArrayBuffer(ifcData);
+                        iframe.contentWindow.postMessage({{
+                            type: 'loadIFC',
+                            buffer: buffer,
+                            fileName: fileName
+                        }}, '*', [buffer]);
+                    }}
                 }}
 
                 if (event.data.type === 'ifcLoaded') {{
@@ -173,6 +263,17 @@ def render_ifc_viewer(ifc_file_bytes: bytes, filename: str, height: int = 650):
                 }}
             }});
 
+            // El visor descarga el modelo directamente desde la URL estática de Streamlit
+            if (modelPath) {{
+                const params = new URLSearchParams({{
+                    modelUrl: new URL(modelPath, document.baseURI).href,
+                    fileName: fileName
+                }});
+                iframe.src = '{VIEWER_URL}?' + params.toString();
+            }} else {{
+                iframe.src = '{VIEWER_URL}';
+            }}
+
             // Timeout si el visor no responde
             setTimeout(() => {{
                 if (!viewerReady) {{
@@ -228,161 +329,204 @@ def render_ifc_viewer_standalone(height: int = 650):
 # FUNCIONES DE VALIDACIÓN (Misma lógica que VIKTOR)
 # ============================================
 
-def get_property_value(entity, property_set_name: str, property_name: str):
-    """Obtiene el valor de una propiedad de una entidad IFC"""
-    try:
-        if hasattr(entity, 'IsDefinedBy'):
-            for definition in entity.IsDefinedBy:
-                if definition.is_a('IfcRelDefinesByProperties'):
-                    property_set = definition.RelatingPropertyDefinition
-                    if property_set.is_a('IfcPropertySet'):
-                        if property_set.Name == property_set_name:
-                            for prop in property_set.HasProperties:
-                                if prop.Name == property_name:
-                                    if hasattr(prop, 'NominalValue'):
-                                        return prop.NominalValue.wrappedValue
-    except Exception:
-        pass
-    return None
+class ValidationResult(NamedTuple):
+    """Resultado de una comprobación (fila de la tabla de resultados)"""
+    entity_type: str
+    global_id: str
+    element_name: str
+    check_description: str
+    expected_value: str
+    actual_value: str
+    status: str
+    error_level: str
+    location: str
+
+
+# Columnas de cada resultado de validación
+RESULT_COLUMNS = list(ValidationResult._fields)
+
+# Columnas con pocos valores distintos: se guardan como categorías para reducir memoria
+CATEGORY_COLUMNS = ['entity_type', 'check_description', 'expected_value', 'status', 'error_level', 'location']
+
+# Tipos de entidad revisados por las validaciones fijas
+GEOMETRY_ENTITY_TYPES = ['IfcWall', 'IfcDoor', 'IfcWindow', 'IfcSlab', 'IfcColumn', 'IfcBeam']
+SPATIAL_ENTITY_TYPES = ['IfcSite', 'IfcBuilding', 'IfcBuildingStorey']
+CLASSIFICATION_ENTITY_TYPES = ['IfcWall', 'IfcDoor', 'IfcWindow']
+
+
+def build_type_cache(ifc_model, entity_types) -> dict:
+    """Materializa by_type una sola vez por tipo: {tipo: entidades}. Los tipos inválidos se omiten"""
+    # by_type lanza una excepción con tipos desconocidos: se filtran antes con los nombres del esquema
+    schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(ifc_model.schema)
+    known_types = {declaration.name().lower() for declaration in schema.declarations()}
+    return {
+        entity_type: ifc_model.by_type(entity_type)
+        for entity_type in entity_types
+        if isinstance(entity_type, str) and entity_type.lower() in known_types
+    }
 
 
-def get_entity_location(entity) -> str:
-    """Obtiene la ubicación (piso) de una entidad"""
-    try:
-        if hasattr(entity, 'ContainedInStructure'):
-            for rel in entity.ContainedInStructure:
-                if rel.is_a('IfcRelContainedInSpatialStructure'):
-                    spatial_element = rel.RelatingStructure
-                    if spatial_element.is_a('IfcBuildingStorey'):
-                        return getattr(spatial_element, 'Name', 'Unknown Storey')
-    except Exception:
-        pass
-    return 'Unknown'
+def build_property_index(ifc_model) -> dict:
+    """
+    Indexa todas las propiedades del modelo en una sola pasada.
+    Devuelve {GlobalId: {PropertySet: {Property: valor}}}.
+    """
+    index = {}
+    for definition in ifc_model.by_type('IfcRelDefinesByProperties'):
+        property_set = definition.RelatingPropertyDefinition
+        if not hasattr(property_set, 'is_a') or not property_set.is_a('IfcPropertySet'):
+            continue
+
+        values = {}
+        for prop in property_set.HasProperties:
+            nominal_value = getattr(prop, 'NominalValue', None)
+            if nominal_value is not None:
+                values.setdefault(prop.Name, nominal_value.wrappedValue)
+
+        for related_object in definition.RelatedObjects:
+            entity_psets = index.setdefault(related_object.GlobalId, {})
+            pset_values = entity_psets.setdefault(property_set.Name, {})
+            for name, value in values.items():
+                pset_values.setdefault(name, value)
+
+    return index
+
+
+def build_location_map(ifc_model) -> dict:
+    """Asocia cada entidad contenida en un piso con su nombre: {GlobalId: piso}"""
+    location_map = {}
+    for rel in ifc_model.by_type('IfcRelContainedInSpatialStructure'):
+        spatial_element = rel.RelatingStructure
+        if spatial_element.is_a('IfcBuildingStorey'):
+            storey_name = getattr(spatial_element, 'Name', 'Unknown Storey')
+            for element in rel.RelatedElements:
+                location_map.setdefault(element.GlobalId, storey_name)
+    return location_map
+
+
+def build_classified_set(ifc_model) -> set:
+    """Reúne los GlobalId de todas las entidades con una clasificación asociada"""
+    return {
+        related_object.GlobalId
+        for rel in ifc_model.by_type('IfcRelAssociatesClassification')
+        for related_object in rel.RelatedObjects
+    }
 
 
-def validate_geometry(ifc_model) -> list:
+def validate_geometry(ifc_model, type_cache: dict, location_map: dict) -> list:
     """Valida la presencia de geometría en entidades clave"""
     results = []
-    entity_types = ['IfcWall', 'IfcDoor', 'IfcWindow', 'IfcSlab', 'IfcColumn', 'IfcBeam']
 
-    for entity_type in entity_types:
+    for entity_type in GEOMETRY_ENTITY_TYPES:
         try:
-            entities = ifc_model.by_type(entity_type)
+            entities = type_cache.get(entity_type, ())
             for entity in entities:
                 has_geometry = hasattr(entity, 'Representation') and entity.Representation is not None
 
-                results.append({
-                    'entity_type': entity_type,
-                    'global_id': getattr(entity, 'GlobalId', 'N/A'),
-                    'element_name': getattr(entity, 'Name', 'Unnamed'),
-                    'check_description': 'Geometry presence check',
-                    'expected_value': 'Has valid geometry',
-                    'actual_value': 'Geometry present' if has_geometry else 'No geometry',
-                    'status': 'Pass' if has_geometry else 'Fail',
-                    'error_level': 'Warning' if not has_geometry else 'Info',
-                    'location': get_entity_location(entity)
-                })
+                results.append(ValidationResult(
+                    entity_type=entity_type,
+                    global_id=getattr(entity, 'GlobalId', 'N/A'),
+                    element_name=getattr(entity, 'Name', 'Unnamed'),
+                    check_description='Geometry presence check',
+                    expected_value='Has valid geometry',
+                    actual_value='Geometry present' if has_geometry else 'No geometry',
+                    status='Pass' if has_geometry else 'Fail',
+                    error_level='Warning' if not has_geometry else 'Info',
+                    location=location_map.get(entity.GlobalId, 'Unknown')
+                ))
         except Exception:
             continue
 
     return results
 
 
-def validate_spatial_structure(ifc_model) -> list:
+def validate_spatial_structure(ifc_model, type_cache: dict) -> list:
     """Valida la estructura espacial jerárquica"""
     results = []
 
     try:
-        sites = ifc_model.by_type('IfcSite')
-        buildings = ifc_model.by_type('IfcBuilding')
-        storeys = ifc_model.by_type('IfcBuildingStorey')
-
-        results.append({
-            'entity_type': 'IfcProject',
-            'global_id': 'N/A',
-            'element_name': 'Spatial Structure',
-            'check_description': 'Site exists in model',
-            'expected_value': 'At least 1 site',
-            'actual_value': f'{len(sites)} site(s)',
-            'status': 'Pass' if len(sites) > 0 else 'Fail',
-            'error_level': 'Critical' if len(sites) == 0 else 'Info',
-            'location': 'Project'
-        })
-
-        results.append({
-            'entity_type': 'IfcProject',
-            'global_id': 'N/A',
-            'element_name': 'Spatial Structure',
-            'check_description': 'Building exists in model',
-            'expected_value': 'At least 1 building',
-            'actual_value': f'{len(buildings)} building(s)',
-            'status': 'Pass' if len(buildings) > 0 else 'Fail',
-            'error_level': 'Critical' if len(buildings) == 0 else 'Info',
-            'location': 'Project'
-        })
-
-        results.append({
-            'entity_type': 'IfcProject',
-            'global_id': 'N/A',
-            'element_name': 'Spatial Structure',
-            'check_description': 'Building storeys exist in model',
-            'expected_value': 'At least 1 storey',
-            'actual_value': f'{len(storeys)} storey(s)',
-            'status': 'Pass' if len(storeys) > 0 else 'Fail',
-            'error_level': 'Warning' if len(storeys) == 0 else 'Info',
-            'location': 'Project'
-        })
+        sites = type_cache['IfcSite']
+        buildings = type_cache['IfcBuilding']
+        storeys = type_cache['IfcBuildingStorey']
+
+        results.append(ValidationResult(
+            entity_type='IfcProject',
+            global_id='N/A',
+            element_name='Spatial Structure',
+            check_description='Site exists in model',
+            expected_value='At least 1 site',
+            actual_value=f'{len(sites)} site(s)',
+            status='Pass' if len(sites) > 0 else 'Fail',
+            error_level='Critical' if len(sites) == 0 else 'Info',
+            location='Project'
+        ))
+
+        results.append(ValidationResult(
+            entity_type='IfcProject',
+            global_id='N/A',
+            element_name='Spatial Structure',
+            check_description='Building exists in model',
+            expected_value='At least 1 building',
+            actual_value=f'{len(buildings)} building(s)',
+            status='Pass' if len(buildings) > 0 else 'Fail',
+            error_level='Critical' if len(buildings) == 0 else 'Info',
+            location='Project'
+        ))
+
+        results.append(ValidationResult(
+            entity_type='IfcProject',
+            global_id='N/A',
+            element_name='Spatial Structure',
+            check_description='Building storeys exist in model',
+            expected_value='At least 1 storey',
+            actual_value=f'{len(storeys)} storey(s)',
+            status='Pass' if len(storeys) > 0 else 'Fail',
+            error_level='Warning' if len(storeys) == 0 else 'Info',
+            location='Project'
+        ))
     except Exception:
         pass
 
     return results
 
 
-def validate_classification(ifc_model) -> list:
-    """Valida las referencias de clasificación"""
+def validate_classification(ifc_model, type_cache: dict, classified: set) -> list:
+    """Valida las referencias de clasificación (classified: GlobalId clasificados, ver build_classified_set)"""
     results = []
 
     try:
-        classifications = ifc_model.by_type('IfcClassification')
-
-        results.append({
-            'entity_type': 'IfcProject',
-            'global_id': 'N/A',
-            'element_name': 'Classification',
-            'check_description': 'Classification system defined',
-            'expected_value': 'At least 1 classification system',
-            'actual_value': f'{len(classifications)} system(s)',
-            'status': 'Pass' if len(classifications) > 0 else 'Fail',
-            'error_level': 'Info',
-            'location': 'Project'
-        })
-
-        entity_types = ['IfcWall', 'IfcDoor', 'IfcWindow']
-        for entity_type in entity_types:
+        classifications = type_cache.get('IfcClassification', ())
+
+        results.append(ValidationResult(
+            entity_type='IfcProject',
+            global_id='N/A',
+            element_name='Classification',
+            check_description='Classification system defined',
+            expected_value='At least 1 classification system',
+            actual_value=f'{len(classifications)} system(s)',
+            status='Pass' if len(classifications) > 0 else 'Fail',
+            error_level='Info',
+            location='Project'
+        ))
+
+        for entity_type in CLASSIFICATION_ENTITY_TYPES:
             try:
-                entities = ifc_model.by_type(entity_type)
-                classified_count = 0
-
-                for entity in entities:
-                    if hasattr(entity, 'HasAssociations'):
-                        for assoc in entity.HasAssociations:
-                            if assoc.is_a('IfcRelAssociatesClassification'):
-                                classified_count += 1
-                                break
+                entities = type_cache.get(entity_type, ())
+                classified_count = sum(1 for entity in entities if entity.GlobalId in classified)
 
                 if len(entities) > 0:
                     percentage = (classified_count / len(entities)) * 100
-                    results.append({
-                        'entity_type': entity_type,
-                        'global_id': 'N/A',
-                        'element_name': 'Classification Coverage',
-                        'check_description': f'{entity_type} classification coverage',
-                        'expected_value': '100% classified',
-                        'actual_value': f'{percentage:.1f}% classified ({classified_count}/{len(entities)})',
-                        'status': 'Pass' if percentage == 100 else 'Fail',
-                        'error_level': 'Info',
-                        'location': 'Project'
-                    })
+                    results.append(ValidationResult(
+                        entity_type=entity_type,
+                        global_id='N/A',
+                        element_name='Classification Coverage',
+                        check_description=f'{entity_type} classification coverage',
+                        expected_value='100% classified',
+                        actual_value=f'{percentage:.1f}% classified ({classified_count}/{len(entities)})',
+                        status='Pass' if percentage == 100 else 'Fail',
+                        error_level='Info',
+                        location='Project'
+                    ))
             except Exception:
                 continue
     except Exception:
@@ -391,106 +535,204 @@ def validate_classification(ifc_model) -> list:
     return results
 
 
-def perform_validation(ifc_model, requirements_df: pd.DataFrame, options: dict) -> list:
-    """Ejecuta todas las validaciones sobre el modelo IFC"""
-    results = []
+def build_property_frame(property_index: dict) -> pd.DataFrame:
+    """Aplana el índice de propiedades en una tabla (global_id, property_set, property_name, value)"""
+    rows = [
+        (global_id, pset_name, prop_name, value)
+        for global_id, entity_psets in property_index.items()
+        for pset_name, pset_values in entity_psets.items()
+        for prop_name, value in pset_values.items()
+    ]
+    return pd.DataFrame(rows, columns=['global_id', 'property_set', 'property_name', 'value'], dtype=object)
 
-    for _, rule in requirements_df.iterrows():
-        entity_type = rule['Entity_Type']
-        property_set = rule['Property_Set']
-        property_name = rule['Property_Name']
-        required = str(rule.get('Required', 'No')).strip().lower() == 'yes'
-        allowed_values = rule.get('Allowed_Values', '')
-        min_value = rule.get('Min_Value', '')
-        max_value = rule.get('Max_Value', '')
-        error_level = rule.get('Error_Level', 'Warning')
 
-        try:
-            entities = ifc_model.by_type(entity_type)
-        except Exception:
-            continue
+def build_entity_frame(entities, location_map: dict) -> pd.DataFrame:
+    """Tabla (global_id, element_name, location) de una lista de entidades IFC"""
+    global_ids = [getattr(entity, 'GlobalId', 'N/A') for entity in entities]
+    return pd.DataFrame({
+        'global_id': global_ids,
+        'element_name': [getattr(entity, 'Name', 'Unnamed') for entity in entities],
+        'location': [location_map.get(global_id, 'Unknown') for global_id in global_ids]
+    }, dtype=object)
+
+
+def compile_rule(rule: dict) -> dict:
+    """
+    Precalcula las constantes de una regla del Excel (lista de valores permitidos, límites
+    numéricos y textos del resultado) para no repetir el parseo durante la evaluación.
+    """
+    property_set = rule['Property_Set']
+    property_name = rule['Property_Name']
+    required = str(rule.get('Required', 'No')).strip().lower() == 'yes'
+    allowed_values = rule.get('Allowed_Values', '')
+    min_value = rule.get('Min_Value', '')
+    max_value = rule.get('Max_Value', '')
+
+    allowed_set = None
+    if allowed_values and str(allowed_values).strip():
+        allowed_set = frozenset(v.strip() for v in str(allowed_values).split(','))
+
+    # Un límite no numérico desactiva los límites siguientes, igual que la validación por entidad
+    min_bound = max_bound = None
+    try:
+        if min_value:
+            min_bound = float(min_value)
+        if max_value:
+            max_bound = float(max_value)
+    except (ValueError, TypeError):
+        pass
+
+    return {
+        'entity_type': rule['Entity_Type'],
+        'property_set': property_set,
+        'property_name': property_name,
+        'check_description': f'Property {property_name} in {property_set}',
+        'required': required,
+        'missing_expected': 'Property exists' if required else 'Optional property',
+        'allowed_set': allowed_set,
+        'allowed_message': f'One of: {allowed_values}',
+        'min_bound': min_bound,
+        'min_message': f'>= {min_value}',
+        'max_bound': max_bound,
+        'max_message': f'<= {max_value}',
+        'error_level': rule.get('Error_Level', 'Warning')
+    }
+
+
+def compile_rules(requirements_df: pd.DataFrame) -> list:
+    """Compila todas las reglas del Excel de una vez (sin iterrows)"""
+    return [compile_rule(rule) for rule in requirements_df.to_dict('records')]
+
+
+def evaluate_rule(rule: dict, entity_frame: pd.DataFrame, property_frame: pd.DataFrame) -> pd.DataFrame:
+    """Evalúa una regla compilada sobre todas las entidades de su tipo con operaciones vectorizadas"""
+    matches = property_frame[
+        (property_frame['property_set'] == rule['property_set']) &
+        (property_frame['property_name'] == rule['property_name'])
+    ]
+    global_ids = entity_frame['global_id']
+    found = global_ids.isin(matches['global_id'])
+    values = global_ids.map(matches.set_index('global_id')['value'])
+    actual_values = values.astype(str)
+
+    no_failure = pd.Series(False, index=entity_frame.index)
+    allowed_failed = min_failed = max_failed = no_failure
+
+    if rule['allowed_set'] is not None:
+        allowed_failed = found & ~actual_values.isin(rule['allowed_set'])
+
+    if rule['min_bound'] is not None or rule['max_bound'] is not None:
+        numeric_values = pd.to_numeric(values, errors='coerce')
+        if rule['min_bound'] is not None:
+            min_failed = numeric_values < rule['min_bound']
+        if rule['max_bound'] is not None:
+            max_failed = numeric_values > rule['max_bound']
+
+    # Si fallan varias comprobaciones prevalece la última (máximo > mínimo > valores permitidos)
+    expected_values = np.select(
+        [max_failed, min_failed, allowed_failed],
+        [rule['max_message'], rule['min_message'], rule['allowed_message']],
+        default='Valid value'
+    )
+
+    failed = found & (allowed_failed | min_failed | max_failed) | (~found & rule['required'])
+
+    return pd.DataFrame({
+        'entity_type': rule['entity_type'],
+        'global_id': global_ids,
+        'element_name': entity_frame['element_name'],
+        'check_description': rule['check_description'],
+        'expected_value': pd.Series(expected_values, index=entity_frame.index).where(
+            found, rule['missing_expected']
+        ),
+        'actual_value': actual_values.where(found, 'Property not found'),
+        'status': np.where(failed, 'Fail', 'Pass'),
+        'error_level': pd.Series('Info', index=entity_frame.index, dtype=object).mask(failed, rule['error_level']),
+        'location': entity_frame['location']
+    })
+
 
-        for entity in entities:
-            global_id = getattr(entity, 'GlobalId', 'N/A')
-            element_name = getattr(entity, 'Name', 'Unnamed')
-            location = get_entity_location(entity)
-
-            property_value = get_property_value(entity, property_set, property_name)
-
-            if property_value is None:
-                if required:
-                    results.append({
-                        'entity_type': entity_type,
-                        'global_id': global_id,
-                        'element_name': element_name,
-                        'check_description': f'Property {property_name} in {property_set}',
-                        'expected_value': 'Property exists',
-                        'actual_value': 'Property not found',
-                        'status': 'Fail',
-                        'error_level': error_level,
-                        'location': location
-                    })
-                else:
-                    results.append({
-                        'entity_type': entity_type,
-                        'global_id': global_id,
-                        'element_name': element_name,
-                        'check_description': f'Property {property_name} in {property_set}',
-                        'expected_value': 'Optional property',
-                        'actual_value': 'Property not found',
-                        'status': 'Pass',
-                        'error_level': 'Info',
-                        'location': location
-                    })
-            else:
-                validation_passed = True
-                expected_value = ''
-                actual_value = str(property_value)
-
-                if allowed_values and str(allowed_values).strip():
-                    allowed_list = [v.strip() for v in str(allowed_values).split(',')]
-                    if str(property_value) not in allowed_list:
-                        validation_passed = False
-                        expected_value = f'One of: {allowed_values}'
-
-                if min_value or max_value:
-                    try:
-                        numeric_value = float(property_value)
-                        if min_value and numeric_value < float(min_value):
-                            validation_passed = False
-                            expected_value = f'>= {min_value}'
-                        if max_value and numeric_value > float(max_value):
-                            validation_passed = False
-                            expected_value = f'<= {max_value}'
-                    except (ValueError, TypeError):
-                        pass
-
-                if not expected_value:
-                    expected_value = 'Valid value'
-
-                results.append({
-                    'entity_type': entity_type,
-                    'global_id': global_id,
-                    'element_name': element_name,
-                    'check_description': f'Property {property_name} in {property_set}',
-                    'expected_value': expected_value,
-                    'actual_value': actual_value,
-                    'status': 'Pass' if validation_passed else 'Fail',
-                    'error_level': error_level if not validation_passed else 'Info',
-                    'location': location
-                })
+class ModelIndex(NamedTuple):
+    """Índices del modelo que no dependen de las reglas ni de las opciones de validación"""
+    location_map: dict
+    property_frame: pd.DataFrame
+    classified: set
+
+
+def build_model_index(ifc_model) -> ModelIndex:
+    """
+    Recorre IfcRelDefinesByProperties, IfcRelContainedInSpatialStructure e
+    IfcRelAssociatesClassification una sola vez por modelo
+    """
+    return ModelIndex(
+        location_map=build_location_map(ifc_model),
+        property_frame=build_property_frame(build_property_index(ifc_model)),
+        classified=build_classified_set(ifc_model)
+    )
+
+
+def validation_entity_types(requirements_df: pd.DataFrame) -> set:
+    """Tipos IFC que consultan las reglas del Excel y las validaciones fijas"""
+    return (
+        set(requirements_df['Entity_Type']) | set(GEOMETRY_ENTITY_TYPES) |
+        set(SPATIAL_ENTITY_TYPES) | set(CLASSIFICATION_ENTITY_TYPES) | {'IfcClassification'}
+    )
+
+
+def perform_validation(ifc_model, requirements_df: pd.DataFrame, options: dict, type_cache: dict = None,
+                       model_index: ModelIndex = None) -> pd.DataFrame:
+    """
+    Ejecuta todas las validaciones sobre el modelo IFC.
+    type_cache y model_index permiten reutilizar las entidades por tipo y los índices del modelo
+    ya construidos (ver build_type_cache y build_model_index).
+    Devuelve una tabla con una fila por comprobación y las columnas RESULT_COLUMNS.
+    """
+    result_frames = []
+    if model_index is None:
+        model_index = build_model_index(ifc_model)
+    location_map, property_frame, classified = model_index
+
+    # Cada tipo se consulta una sola vez aunque lo usen varias reglas y validaciones
+    if type_cache is None:
+        type_cache = build_type_cache(ifc_model, validation_entity_types(requirements_df))
+    entity_frames = {}
 
     # Validaciones adicionales según opciones
+    fixed_checks = []
     if options.get('validate_geometry', True):
-        results.extend(validate_geometry(ifc_model))
+        fixed_checks.append((validate_geometry, (ifc_model, type_cache, location_map)))
 
     if options.get('validate_spatial', True):
-        results.extend(validate_spatial_structure(ifc_model))
+        fixed_checks.append((validate_spatial_structure, (ifc_model, type_cache)))
 
     if options.get('validate_classification', True):
-        results.extend(validate_classification(ifc_model))
+        fixed_checks.append((validate_classification, (ifc_model, type_cache, classified)))
 
-    return results
+    # Las validaciones fijas solo leen el modelo y los índices ya construidos:
+    # se ejecutan en hilos mientras el hilo principal evalúa las reglas del Excel
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(check, *args) for check, args in fixed_checks]
+
+        for rule in compile_rules(requirements_df):
+            entity_type = rule['entity_type']
+            if not type_cache.get(entity_type):
+                continue
+
+            if entity_type not in entity_frames:
+                entity_frames[entity_type] = build_entity_frame(type_cache[entity_type], location_map)
+            result_frames.append(evaluate_rule(rule, entity_frames[entity_type], property_frame))
+
+        # Mismo orden que la ejecución secuencial
+        results = list(chain.from_iterable(future.result() for future in futures))
+
+    if results:
+        result_frames.append(pd.DataFrame(results, columns=RESULT_COLUMNS, dtype=object))
+
+    if not result_frames:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    results_df = pd.concat(result_frames, ignore_index=True)
+    return results_df.astype({column: 'category' for column in CATEGORY_COLUMNS})
 
 
 # ============================================
@@ -516,7 +758,8 @@ def create_excel_template():
     df = pd.DataFrame(template_data)
     output = BytesIO()
 
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    # xlsxwriter escribe bastante más rápido que openpyxl (openpyxl se sigue usando para leer)
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         df.to_excel(writer, sheet_name='Validation Rules', index=False)
 
         instructions = pd.DataFrame({
@@ -544,15 +787,137 @@ def create_excel_template():
     return output
 
 
-def generate_pdf_report(validation_results, ifc_model, requirements_df, ifc_filename):
-    """Genera el reporte PDF de validación"""
-    total_checks = len(validation_results)
-    passed_checks = sum(1 for r in validation_results if r['status'] == 'Pass')
-    failed_checks = total_checks - passed_checks
-    compliance_score = (passed_checks / total_checks * 100) if total_checks > 0 else 0
+def summarize_results(results_df: pd.DataFrame, fail_mask: pd.Series = None) -> dict:
+    """Resume los resultados (totales, cumplimiento y fallos por severidad) con un solo value_counts"""
+    if fail_mask is None:
+        fail_mask = results_df['status'].eq('Fail')
+    failed_levels = results_df.loc[fail_mask, 'error_level']
+    level_counts = failed_levels.value_counts()
+
+    total_checks = len(results_df)
+    failed_checks = len(failed_levels)
+    passed_checks = total_checks - failed_checks
+
+    return {
+        'total_checks': total_checks,
+        'passed_checks': passed_checks,
+        'failed_checks': failed_checks,
+        'compliance_score': (passed_checks / total_checks * 100) if total_checks > 0 else 0,
+        'critical': int(level_counts.get('Critical', 0)),
+        'warning': int(level_counts.get('Warning', 0)),
+        'info': int(level_counts.get('Info', 0))
+    }
+
+
+# Límite por defecto de fallos incluidos en el JSON
+JSON_MAX_FAILED_CHECKS = 10000
+# Límite por defecto de filas (de todos los resultados) del CSV reducido
+CSV_MAX_ROWS = 10000
+
+# Hallazgos listados por severidad en el reporte PDF
+PDF_MAX_FINDINGS = 2000
+# Filas por tabla: cada tabla se maqueta por separado, así el coste crece de forma lineal
+PDF_FINDINGS_CHUNK_ROWS = 500
+
+
+# Anchos de columna (pulgadas) de la tabla de hallazgos: #, Entity, Check, Expected, Got
+FINDINGS_COL_WIDTHS = [0.4, 1.1, 2.1, 1.3, 1.3]
+FINDINGS_FONT_SIZE = 7
+
+
+def clip_text(value, max_width: float) -> str:
+    """Recorta un texto para que quepa en una celda de la tabla de hallazgos"""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    text = str(value)
+    if stringWidth(text, 'Helvetica', FINDINGS_FONT_SIZE) <= max_width:
+        return text
 
-    critical_count = sum(1 for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Critical')
-    warning_count = sum(1 for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Warning')
+    # Una sola pasada: se acumula el ancho carácter a carácter hasta el punto de corte
+    available = max_width - stringWidth('...', 'Helvetica', FINDINGS_FONT_SIZE)
+    width = 0
+    for index, char in enumerate(text):
+        width += stringWidth(char, 'Helvetica', FINDINGS_FONT_SIZE)
+        if width > available:
+            return text[:index] + '...'
+    return text + '...'
+
+
+def build_findings_table(failures: pd.DataFrame, first_number: int = 1):
+    """Tabla de hallazgos del PDF: una sola LongTable en lugar de un Paragraph por fila"""
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.platypus import LongTable, TableStyle
+
+    # Ancho útil de cada celda descontando el padding horizontal (6 pt por lado)
+    cell_widths = [width * inch - 12 for width in FINDINGS_COL_WIDTHS]
+
+    data = [['#', 'Entity', 'Check', 'Expected', 'Got']]
+    data.extend(
+        [
+            str(i),
+            clip_text(entity_type, cell_widths[1]),
+            clip_text(check_description, cell_widths[2]),
+            clip_text(expected_value, cell_widths[3]),
+            clip_text(actual_value, cell_widths[4])
+        ]
+        for i, (entity_type, check_description, expected_value, actual_value) in enumerate(zip(
+            failures['entity_type'], failures['check_description'],
+            failures['expected_value'], failures['actual_value']
+        ), first_number)
+    )
+
+    table = LongTable(data, colWidths=[width * inch for width in FINDINGS_COL_WIDTHS], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1976D2')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), FINDINGS_FONT_SIZE),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ('TOPPADDING', (0, 0), (-1, -1), 3),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F5F5F5')])
+    ]))
+    return table
+
+
+def build_findings_tables(failures: pd.DataFrame) -> list:
+    """Divide los hallazgos en tablas de PDF_FINDINGS_CHUNK_ROWS filas separadas por un espacio"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Spacer
+
+    flowables = []
+    for start in range(0, len(failures), PDF_FINDINGS_CHUNK_ROWS):
+        if flowables:
+            flowables.append(Spacer(1, 0.1*inch))
+        chunk = failures.iloc[start:start + PDF_FINDINGS_CHUNK_ROWS]
+        flowables.append(build_findings_table(chunk, first_number=start + 1))
+    return flowables
+
+
+def generate_pdf_report(results_df: pd.DataFrame, ifc_model, requirements_df, ifc_filename,
+                        total_entities: int, generated_at: datetime = None) -> bytes:
+    """Genera el reporte PDF de validación (con fecha generated_at, por defecto ahora) y devuelve sus bytes"""
+    if generated_at is None:
+        generated_at = datetime.now()
+
+    # Importación diferida: reportlab solo se carga al generar el reporte
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+
+    summary = summarize_results(results_df)
+    total_checks = summary['total_checks']
+    passed_checks = summary['passed_checks']
+    failed_checks = summary['failed_checks']
+    compliance_score = summary['compliance_score']
+    critical_count = summary['critical']
+    warning_count = summary['warning']
 
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.75*inch, bottomMargin=0.75*inch)
@@ -586,8 +951,8 @@ def generate_pdf_report(validation_results, ifc_model, requirements_df, ifc_file
     project_data = [
         ['IFC File:', ifc_filename],
         ['IFC Schema:', ifc_model.schema],
-        ['Report Date:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-        ['Total Entities:', str(len(ifc_model.by_type("IfcRoot")))],
+        ['Report Date:', generated_at.strftime('%Y-%m-%d %H:%M:%S')],
+        ['Total Entities:', str(total_entities)],
         ['Validation Rules:', str(len(requirements_df))]
     ]
 
@@ -635,39 +1000,38 @@ def generate_pdf_report(validation_results, ifc_model, requirements_df, ifc_file
     story.append(PageBreak())
     story.append(Paragraph("Detailed Findings", heading_style))
 
-    critical_failures = [r for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Critical']
-    warning_failures = [r for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Warning']
+    # Separar los fallos por severidad en una sola pasada
+    failed_df = results_df[results_df['status'] == 'Fail']
+    failures_by_level = dict(list(failed_df.groupby('error_level', observed=True, sort=False)))
+    critical_failures = failures_by_level.get('Critical', failed_df.iloc[:0])
+    warning_failures = failures_by_level.get('Warning', failed_df.iloc[:0])
 
-    if critical_failures:
+    if not critical_failures.empty:
         story.append(Paragraph(f"Critical Errors ({len(critical_failures)})", styles['Heading3']))
-        for i, failure in enumerate(critical_failures[:20], 1):
-            story.append(Paragraph(
-                f"{i}. {failure['entity_type']} - {failure['check_description']}: "
-                f"Expected '{failure['expected_value']}', Got '{failure['actual_value']}'",
-                styles['Normal']
-            ))
-        if len(critical_failures) > 20:
-            story.append(Paragraph(f"... and {len(critical_failures) - 20} more", styles['Italic']))
+        story.extend(build_findings_tables(critical_failures.head(PDF_MAX_FINDINGS)))
+        if len(critical_failures) > PDF_MAX_FINDINGS:
+            story.append(Paragraph(f"... and {len(critical_failures) - PDF_MAX_FINDINGS} more", styles['Italic']))
         story.append(Spacer(1, 0.2*inch))
 
-    if warning_failures:
+    if not warning_failures.empty:
         story.append(Paragraph(f"Warnings ({len(warning_failures)})", styles['Heading3']))
-        for i, failure in enumerate(warning_failures[:20], 1):
-            story.append(Paragraph(
-                f"{i}. {failure['entity_type']} - {failure['check_description']}: "
-                f"Expected '{failure['expected_value']}', Got '{failure['actual_value']}'",
-                styles['Normal']
-            ))
-        if len(warning_failures) > 20:
-            story.append(Paragraph(f"... and {len(warning_failures) - 20} more", styles['Italic']))
+        story.extend(build_findings_tables(warning_failures.head(PDF_MAX_FINDINGS)))
+        if len(warning_failures) > PDF_MAX_FINDINGS:
+            story.append(Paragraph(f"... and {len(warning_failures) - PDF_MAX_FINDINGS} more", styles['Italic']))
 
     doc.build(story)
-    buffer.seek(0)
-    return buffer
+    # Devolver solo los bytes y liberar el buffer de inmediato
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
 
 
-def create_validation_charts(validation_results):
+def create_validation_charts(results_df: pd.DataFrame):
     """Crea los gráficos de validación con Plotly"""
+    # Importación diferida: plotly solo se carga al dibujar los gráficos
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     fig = make_subplots(
         rows=2, cols=2,
         subplot_titles=(
@@ -682,9 +1046,13 @@ def create_validation_charts(validation_results):
         ]
     )
 
+    # Todos los conteos salen de la tabla de resultados
+    status_counts = results_df['status'].value_counts()
+    failed_df = results_df[results_df['status'] == 'Fail']
+
     # 1. Pie Chart Pass/Fail
-    passed = sum(1 for r in validation_results if r['status'] == 'Pass')
-    failed = sum(1 for r in validation_results if r['status'] == 'Fail')
+    passed = int(status_counts.get('Pass', 0))
+    failed = int(status_counts.get('Fail', 0))
 
     fig.add_trace(
         go.Pie(
@@ -697,16 +1065,12 @@ def create_validation_charts(validation_results):
     )
 
     # 2. Errores por severidad
-    severity_counts = {}
-    for result in validation_results:
-        if result['status'] == 'Fail':
-            level = result['error_level']
-            severity_counts[level] = severity_counts.get(level, 0) + 1
+    severity_counts = failed_df['error_level'].value_counts()
 
     severity_colors = {'Critical': '#F44336', 'Warning': '#FF9800', 'Info': '#2196F3'}
 
     for severity in ['Critical', 'Warning', 'Info']:
-        count = severity_counts.get(severity, 0)
+        count = int(severity_counts.get(severity, 0))
         fig.add_trace(
             go.Bar(
                 x=[severity],
@@ -719,20 +1083,14 @@ def create_validation_charts(validation_results):
         )
 
     # 3. Errores por tipo de entidad
-    entity_errors = {}
-    for result in validation_results:
-        if result['status'] == 'Fail':
-            entity = result['entity_type']
-            entity_errors[entity] = entity_errors.get(entity, 0) + 1
+    entity_errors = failed_df['entity_type'].value_counts()
+    entity_errors = entity_errors[entity_errors > 0].head(10)
 
-    sorted_entities = sorted(entity_errors.items(), key=lambda x: x[1], reverse=True)[:10]
-
-    if sorted_entities:
-        entities, counts = zip(*sorted_entities)
+    if not entity_errors.empty:
         fig.add_trace(
             go.Bar(
-                x=list(counts),
-                y=list(entities),
+                x=entity_errors.tolist(),
+                y=entity_errors.index.tolist(),
                 orientation='h',
                 marker_color='#9C27B0',
                 showlegend=False
@@ -741,7 +1099,7 @@ def create_validation_charts(validation_results):
         )
 
     # 4. Indicador de compliance
-    total_checks = len(validation_results)
+    total_checks = len(results_df)
     compliance_score = (passed / total_checks * 100) if total_checks > 0 else 0
 
     fig.add_trace(
@@ -779,6 +1137,280 @@ def create_validation_charts(validation_results):
     return fig
 
 
+# ============================================
+# CARGA DE ARCHIVOS (CACHÉ ENTRE RERUNS)
+# ============================================
+
+def file_digest(file_bytes) -> str:
+    """Calcula el hash XXH3-128 de un archivo subido, usado como clave de caché"""
+    # xxhash no es criptográfico pero procesa varios GB/s; basta para distinguir archivos subidos
+    return xxhash.xxh3_128_hexdigest(file_bytes)
+
+
+# Modelos IFC abiertos que se mantienen en memoria a la vez
+MAX_CACHED_MODELS = 4
+
+
+@st.cache_data(show_spinner=False)
+def get_template_bytes() -> bytes:
+    """Plantilla Excel generada una sola vez por proceso"""
+    return create_excel_template().getvalue()
+
+
+@st.cache_resource(show_spinner="Loading IFC model...", max_entries=MAX_CACHED_MODELS)
+def load_ifc_model(digest: str, _ifc_buffer):
+    """Abre el modelo IFC una sola vez por archivo; los reruns reutilizan el modelo en caché"""
+    # Guardar IFC en un temporal privado (ifcopenshell necesita un archivo)
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.ifc') as tmp_file:
+        tmp_file.write(_ifc_buffer)
+        tmp_path = tmp_file.name
+
+    try:
+        return ifcopenshell.open(tmp_path)
+    finally:
+        # Limpiar archivo temporal
+        os.unlink(tmp_path)
+
+
+# Tipos listados en el resumen de entidades del modelo
+SUMMARY_ENTITY_TYPES = ['IfcWall', 'IfcDoor', 'IfcWindow', 'IfcSlab', 'IfcColumn', 'IfcBeam', 'IfcSpace']
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def summarize_model(digest: str, _ifc_model) -> dict:
+    """
+    Cuenta las entidades del modelo una sola vez por archivo.
+    by_type crea un proxy Python por entidad, algo costoso para IfcRoot en modelos grandes.
+    """
+    type_cache = build_type_cache(_ifc_model, SUMMARY_ENTITY_TYPES)
+    return {
+        'schema': _ifc_model.schema,
+        'root_count': len(_ifc_model.by_type('IfcRoot')),
+        'product_count': len(_ifc_model.by_type('IfcProduct')),
+        'counts': {entity_type: len(entities) for entity_type, entities in type_cache.items()}
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def load_requirements(digest: str, _excel_bytes: bytes) -> pd.DataFrame:
+    """Lee el Excel de requisitos una sola vez por archivo"""
+    return pd.read_excel(BytesIO(_excel_bytes))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def load_model_index(model_digest: str, _ifc_model) -> ModelIndex:
+    """Índices de propiedades y ubicaciones construidos una sola vez por modelo, no por cada validación"""
+    return build_model_index(_ifc_model)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def load_type_cache(model_digest: str, rules_digest: str, _ifc_model, _requirements_df) -> dict:
+    """Consulta las entidades por tipo una sola vez por modelo y reglas; cambiar las opciones no repite by_type"""
+    return build_type_cache(_ifc_model, validation_entity_types(_requirements_df))
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def run_validation(model_digest: str, rules_digest: str, options_key: tuple, _ifc_model, _requirements_df,
+                   _type_cache: dict, _model_index: ModelIndex) -> pd.DataFrame:
+    """
+    Ejecuta perform_validation una sola vez por combinación de modelo, reglas y opciones.
+    El modelo y las reglas no se hashean: la clave son los digests de los archivos subidos.
+    Se guarda como recurso para que cada rerun reciba la misma tabla (de solo lectura)
+    en lugar de una copia deserializada.
+    """
+    return perform_validation(_ifc_model, _requirements_df, dict(options_key), _type_cache, _model_index)
+
+
+# Las exportaciones son bytes inmutables: se guardan como recurso para que cada rerun
+# reutilice el mismo objeto en lugar de una copia deserializada
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def get_pdf_bytes(validation_key: tuple, ifc_filename: str, total_entities: int, generated_at: datetime,
+                  _results_df, _ifc_model, _requirements_df) -> bytes:
+    """Reporte PDF generado una sola vez por validación y fecha de exportación de la sesión"""
+    return generate_pdf_report(
+        _results_df, _ifc_model, _requirements_df, ifc_filename, total_entities, generated_at
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def get_csv_bytes(validation_key: tuple, _results_df) -> bytes:
+    """CSV de resultados generado una sola vez por validación"""
+    return _results_df.to_csv(index=False).encode('utf-8')
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_csv_head_bytes(validation_key: tuple, max_rows: int, _results_df) -> bytes:
+    """CSV con las primeras max_rows filas; solo se conserva el último generado"""
+    return _results_df.head(max_rows).to_csv(index=False).encode('utf-8')
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def get_json_bytes(validation_key: tuple, ifc_filename: str, total_entities: int, validation_summary: dict,
+                   error_breakdown: dict, max_failed_checks: int, generated_at: datetime, _results_df,
+                   _fail_mask, _ifc_model, _requirements_df) -> bytes:
+    """
+    Resumen JSON generado una sola vez por validación y fecha de exportación de la sesión,
+    con como mucho max_failed_checks fallos
+    """
+    failed_df = _results_df.loc[_fail_mask]
+
+    summary = {
+        'report_metadata': {
+            'generated_at': generated_at.isoformat(),
+            'ifc_file': ifc_filename,
+            'ifc_schema': _ifc_model.schema,
+            'total_entities': total_entities,
+            'validation_rules': len(_requirements_df)
+        },
+        'validation_summary': validation_summary,
+        'error_breakdown': error_breakdown,
+        'failed_checks': failed_df.head(max_failed_checks).to_dict(orient='records'),
+        'failed_checks_truncated': len(failed_df) > max_failed_checks
+    }
+    # orjson serializa en C y admite escalares de numpy directamente
+    return orjson.dumps(summary, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def get_validation_figure(validation_key: tuple, _results_df):
+    """Figura de Plotly construida una sola vez por validación (st.plotly_chart no la modifica)"""
+    return create_validation_charts(_results_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_MODELS)
+def get_filter_options(validation_key: tuple, show_passed: bool, _display_df) -> tuple:
+    """Opciones de los filtros de la tabla de resultados, calculadas una vez por validación"""
+    return (
+        _display_df['entity_type'].unique().tolist(),
+        _display_df['status'].unique().tolist()
+    )
+
+
+# ============================================
+# SECCIONES DE RESULTADOS (FRAGMENTS)
+# ============================================
+# Cada sección es un st.fragment: al interactuar con ella solo se vuelve a
+# ejecutar esa sección, no la página completa.
+
+@st.fragment
+def render_viewer_section(ifc_buffer, filename: str, digest: str):
+    """Visor 3D con That Open Components"""
+    render_ifc_viewer(ifc_buffer, filename, digest, height=650)
+
+
+@st.fragment
+def render_charts_section(validation_key: tuple, results_df: pd.DataFrame):
+    """Gráficos de validación"""
+    fig = get_validation_figure(validation_key, results_df)
+    st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def render_results_section(validation_key: tuple, results_df: pd.DataFrame, fail_mask: pd.Series,
+                           show_passed: bool):
+    """Tabla de resultados detallados; los filtros solo vuelven a ejecutar esta sección"""
+    # Filtrar resultados
+    display_df = results_df if show_passed else results_df.loc[fail_mask]
+
+    if not display_df.empty:
+        entity_options, status_options = get_filter_options(validation_key, show_passed, display_df)
+
+        # Filtros
+        col1, col2 = st.columns(2)
+        with col1:
+            entity_filter = st.multiselect(
+                "Filter by Entity Type",
+                options=entity_options,
+                default=[]
+            )
+        with col2:
+            status_filter = st.multiselect(
+                "Filter by Status",
+                options=status_options,
+                default=[]
+            )
+
+        # Aplicar filtros combinando máscaras: una sola copia al final
+        mask = pd.Series(True, index=display_df.index)
+        if entity_filter:
+            mask &= display_df['entity_type'].isin(entity_filter)
+        if status_filter:
+            mask &= display_df['status'].isin(status_filter)
+
+        st.dataframe(
+            display_df.loc[mask],
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "status": st.column_config.TextColumn("Status"),
+                "error_level": st.column_config.TextColumn("Severity"),
+            }
+        )
+    else:
+        st.success("✅ All validation checks passed!")
+
+
+@st.fragment
+def render_export_section(validation_key: tuple, results_df: pd.DataFrame, fail_mask: pd.Series, ifc_model,
+                          requirements_df, ifc_filename: str, total_entities: int, validation_summary: dict,
+                          error_breakdown: dict, max_json_failed_checks: int, max_csv_rows: int):
+    """Botones de exportación a PDF, CSV y JSON; cada archivo se genera una vez por validación"""
+    st.divider()
+    st.subheader("📥 Export Results")
+
+    # Una fecha de exportación por validación y sesión: la comparten los nombres de archivo
+    # y el contenido de los reportes, y no cambia entre reruns
+    if st.session_state.get('export_key') != validation_key:
+        st.session_state['export_key'] = validation_key
+        st.session_state['export_generated_at'] = datetime.now().replace(microsecond=0)
+    generated_at = st.session_state['export_generated_at']
+    timestamp = generated_at.strftime('%Y%m%d_%H%M%S')
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        # PDF Report
+        st.download_button(
+            label="📄 Download PDF Report",
+            data=get_pdf_bytes(
+                validation_key, ifc_filename, total_entities, generated_at,
+                results_df, ifc_model, requirements_df
+            ),
+            file_name=f"IFC_Validation_Report_{timestamp}.pdf",
+            mime="application/pdf"
+        )
+
+    with col2:
+        # CSV Export
+        st.download_button(
+            label="📊 Export to CSV",
+            data=get_csv_bytes(validation_key, results_df),
+            file_name=f"IFC_Validation_Results_{timestamp}.csv",
+            mime="text/csv"
+        )
+
+        # CSV reducido: solo se genera si el completo supera el límite de filas
+        if len(results_df) > max_csv_rows:
+            st.download_button(
+                label=f"📊 Export first {max_csv_rows} rows to CSV",
+                data=get_csv_head_bytes(validation_key, max_csv_rows, results_df),
+                file_name=f"IFC_Validation_Results_top{max_csv_rows}_{timestamp}.csv",
+                mime="text/csv"
+            )
+
+    with col3:
+        # JSON Export
+        st.download_button(
+            label="📋 Export to JSON",
+            data=get_json_bytes(
+                validation_key, ifc_filename, total_entities, validation_summary, error_breakdown,
+                max_json_failed_checks, generated_at, results_df, fail_mask, ifc_model, requirements_df
+            ),
+            file_name=f"IFC_Validation_Summary_{timestamp}.json",
+            mime="application/json"
+        )
+
+
 # ============================================
 # INTERFAZ DE USUARIO STREAMLIT
 # ============================================
@@ -800,10 +1432,9 @@ def main():
 
         # Descargar plantilla
         st.subheader("📋 Template")
-        template_buffer = create_excel_template()
         st.download_button(
             label="Download Excel Template",
-            data=template_buffer,
+            data=get_template_bytes(),
             file_name="IFC_Validation_Template.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -816,6 +1447,25 @@ def main():
         validate_classification = st.checkbox("Validate Classification References", value=True)
         show_passed = st.checkbox("Show Passed Checks in Table", value=False)
 
+        st.divider()
+
+        st.header("📥 Export Options")
+        max_json_failed_checks = st.number_input(
+            "Max failed checks in JSON",
+            min_value=1,
+            value=JSON_MAX_FAILED_CHECKS,
+            step=1000,
+            help="Failed checks beyond this limit are left out of the JSON export"
+        )
+        max_csv_rows = st.number_input(
+            "Max rows in reduced CSV",
+            min_value=1,
+            value=CSV_MAX_ROWS,
+            step=1000,
+            help="When the results (passed and failed) exceed this many rows, "
+                 "an extra CSV with only the first rows is offered"
+        )
+
     # Contenido principal
     if ifc_file is None:
         st.info("👆 Please upload an IFC file from the sidebar to begin.")
@@ -839,15 +1489,13 @@ def main():
 
     # Procesar archivo IFC
     try:
-        # Guardar IFC temporalmente (ifcopenshell necesita un archivo)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.ifc') as tmp_file:
-            tmp_file.write(ifc_file.getvalue())
-            tmp_path = tmp_file.name
-
-        ifc_model = ifcopenshell.open(tmp_path)
-
-        # Limpiar archivo temporal
-        os.unlink(tmp_path)
+        # El modelo se parsea solo la primera vez; los reruns lo recuperan de la caché
+        # getbuffer() expone el archivo subido sin copiarlo; se reutiliza en la carga y el visor
+        ifc_buffer = ifc_file.getbuffer()
+        ifc_digest = file_digest(ifc_buffer)
+        ifc_model = load_ifc_model(ifc_digest, ifc_buffer)
+        model_summary = summarize_model(ifc_digest, ifc_model)
+        total_entities = model_summary['root_count']
 
         # ============================================
         # TABS DE RESULTADOS
@@ -862,33 +1510,27 @@ def main():
                 st.caption("Use mouse to rotate (left click), pan (right click), and zoom (scroll)")
 
                 # Renderizar visor 3D con That Open Components
-                render_ifc_viewer(ifc_file.getvalue(), ifc_file.name, height=650)
+                render_viewer_section(ifc_buffer, ifc_file.name, ifc_digest)
 
             with tab2:
                 st.subheader("Model Information")
                 col1, col2, col3 = st.columns(3)
 
                 with col1:
-                    st.metric("IFC Schema", ifc_model.schema)
+                    st.metric("IFC Schema", model_summary['schema'])
                 with col2:
-                    st.metric("Total Entities", len(ifc_model.by_type('IfcRoot')))
+                    st.metric("Total Entities", total_entities)
                 with col3:
-                    st.metric("Products", len(ifc_model.by_type('IfcProduct')))
+                    st.metric("Products", model_summary['product_count'])
 
                 st.divider()
 
                 # Resumen de entidades
                 st.subheader("Entity Summary")
-                entity_types = ['IfcWall', 'IfcDoor', 'IfcWindow', 'IfcSlab', 'IfcColumn', 'IfcBeam', 'IfcSpace']
-                entity_counts = []
-
-                for et in entity_types:
-                    try:
-                        count = len(ifc_model.by_type(et))
-                        if count > 0:
-                            entity_counts.append({'Entity Type': et, 'Count': count})
-                    except:
-                        pass
+                entity_counts = [
+                    {'Entity Type': et, 'Count': count}
+                    for et, count in model_summary['counts'].items() if count > 0
+                ]
 
                 if entity_counts:
                     st.dataframe(pd.DataFrame(entity_counts), use_container_width=True, hide_index=True)
@@ -898,7 +1540,9 @@ def main():
             return
 
         # Con Excel - validación completa
-        requirements_df = pd.read_excel(excel_file)
+        excel_bytes = excel_file.getvalue()
+        rules_digest = file_digest(excel_bytes)
+        requirements_df = load_requirements(rules_digest, excel_bytes)
 
         # Validar estructura del Excel
         required_columns = ['Entity_Type', 'Property_Set', 'Property_Name', 'Required', 'Error_Level']
@@ -915,18 +1559,26 @@ def main():
             'validate_classification': validate_classification
         }
 
+        # Clave de la validación: archivos subidos y opciones activas
+        validation_key = (ifc_digest, rules_digest, tuple(sorted(options.items())))
+
+        type_cache = load_type_cache(ifc_digest, rules_digest, ifc_model, requirements_df)
+
         with st.spinner("Running validation..."):
-            validation_results = perform_validation(ifc_model, requirements_df, options)
+            model_index = load_model_index(ifc_digest, ifc_model)
+            results_df = run_validation(*validation_key, ifc_model, requirements_df, type_cache, model_index)
 
-        # Calcular estadísticas
-        total_checks = len(validation_results)
-        passed_checks = sum(1 for r in validation_results if r['status'] == 'Pass')
-        failed_checks = total_checks - passed_checks
-        compliance_score = (passed_checks / total_checks * 100) if total_checks > 0 else 0
+        # Calcular estadísticas: una máscara de fallos y un solo value_counts
+        fail_mask = results_df['status'].eq('Fail')
+        stats = summarize_results(results_df, fail_mask)
+        total_checks = stats['total_checks']
+        passed_checks = stats['passed_checks']
+        failed_checks = stats['failed_checks']
+        compliance_score = stats['compliance_score']
 
-        critical_count = sum(1 for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Critical')
-        warning_count = sum(1 for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Warning')
-        info_count = sum(1 for r in validation_results if r['status'] == 'Fail' and r['error_level'] == 'Info')
+        critical_count = stats['critical']
+        warning_count = stats['warning']
+        info_count = stats['info']
 
         # Tabs con visor 3D incluido
         tab1, tab2, tab3, tab4 = st.tabs(["📊 Summary", "🏗️ 3D Viewer", "📈 Charts", "📋 Detailed Results"])
@@ -960,134 +1612,56 @@ def main():
 
             with col1:
                 st.subheader("📁 File Information")
-                st.write(f"**IFC Schema:** {ifc_model.schema}")
-                st.write(f"**Total Entities:** {len(ifc_model.by_type('IfcRoot'))}")
+                st.write(f"**IFC Schema:** {model_summary['schema']}")
+                st.write(f"**Total Entities:** {total_entities}")
                 st.write(f"**Validation Rules:** {len(requirements_df)}")
 
             with col2:
                 st.subheader("⚠️ Error Breakdown")
-                st.write(f"🔴 **Critical Errors:** {critical_count}")
-                st.write(f"🟠 **Warnings:** {warning_count}")
-                st.write(f"🔵 **Info:** {info_count}")
+                # Una sola tabla en lugar de un elemento por severidad
+                st.markdown(
+                    "| Severity | Count |\n"
+                    "|---|---|\n"
+                    f"| 🔴 **Critical Errors** | {critical_count} |\n"
+                    f"| 🟠 **Warnings** | {warning_count} |\n"
+                    f"| 🔵 **Info** | {info_count} |"
+                )
 
         with tab2:
             st.subheader("IFC 3D Viewer")
             st.caption("Controls: Left click + drag to rotate | Right click + drag to pan | Scroll to zoom")
 
             # Renderizar visor 3D con That Open Components
-            render_ifc_viewer(ifc_file.getvalue(), ifc_file.name, height=650)
+            render_viewer_section(ifc_buffer, ifc_file.name, ifc_digest)
 
         with tab3:
             st.subheader("Validation Charts")
-            fig = create_validation_charts(validation_results)
-            st.plotly_chart(fig, use_container_width=True)
+            render_charts_section(validation_key, results_df)
 
         with tab4:
             st.subheader("Detailed Validation Results")
 
-            # Filtrar resultados
-            display_results = validation_results if show_passed else [r for r in validation_results if r['status'] == 'Fail']
-
-            if display_results:
-                df = pd.DataFrame(display_results)
-
-                # Filtros
-                col1, col2 = st.columns(2)
-                with col1:
-                    entity_filter = st.multiselect(
-                        "Filter by Entity Type",
-                        options=df['entity_type'].unique(),
-                        default=[]
-                    )
-                with col2:
-                    status_filter = st.multiselect(
-                        "Filter by Status",
-                        options=df['status'].unique(),
-                        default=[]
-                    )
-
-                # Aplicar filtros
-                if entity_filter:
-                    df = df[df['entity_type'].isin(entity_filter)]
-                if status_filter:
-                    df = df[df['status'].isin(status_filter)]
-
-                st.dataframe(
-                    df,
-                    use_container_width=True,
-                    hide_index=True,
-                    column_config={
-                        "status": st.column_config.TextColumn("Status"),
-                        "error_level": st.column_config.TextColumn("Severity"),
-                    }
-                )
-            else:
-                st.success("✅ All validation checks passed!")
+            render_results_section(validation_key, results_df, fail_mask, show_passed)
 
         # ============================================
         # BOTONES DE EXPORTACIÓN
         # ============================================
-        st.divider()
-        st.subheader("📥 Export Results")
-
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            # PDF Report
-            pdf_buffer = generate_pdf_report(
-                validation_results, ifc_model, requirements_df, ifc_file.name
-            )
-            st.download_button(
-                label="📄 Download PDF Report",
-                data=pdf_buffer,
-                file_name=f"IFC_Validation_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                mime="application/pdf"
-            )
-
-        with col2:
-            # CSV Export
-            csv_df = pd.DataFrame(validation_results)
-            csv_buffer = BytesIO()
-            csv_df.to_csv(csv_buffer, index=False)
-            csv_buffer.seek(0)
-
-            st.download_button(
-                label="📊 Export to CSV",
-                data=csv_buffer,
-                file_name=f"IFC_Validation_Results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
-
-        with col3:
-            # JSON Export
-            summary = {
-                'report_metadata': {
-                    'generated_at': datetime.now().isoformat(),
-                    'ifc_file': ifc_file.name,
-                    'ifc_schema': ifc_model.schema,
-                    'total_entities': len(ifc_model.by_type("IfcRoot")),
-                    'validation_rules': len(requirements_df)
-                },
-                'validation_summary': {
-                    'compliance_score': round(compliance_score, 2),
-                    'total_checks': total_checks,
-                    'passed_checks': passed_checks,
-                    'failed_checks': failed_checks
-                },
-                'error_breakdown': {
-                    'critical': critical_count,
-                    'warning': warning_count,
-                    'info': info_count
-                },
-                'failed_checks': [r for r in validation_results if r['status'] == 'Fail']
-            }
-
-            st.download_button(
-                label="📋 Export to JSON",
-                data=json.dumps(summary, indent=2),
-                file_name=f"IFC_Validation_Summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
-            )
+        render_export_section(
+            validation_key, results_df, fail_mask, ifc_model, requirements_df, ifc_file.name, total_entities,
+            validation_summary={
+                'compliance_score': round(compliance_score, 2),
+                'total_checks': total_checks,
+                'passed_checks': passed_checks,
+                'failed_checks': failed_checks
+            },
+            error_breakdown={
+                'critical': critical_count,
+                'warning': warning_count,
+                'info': info_count
+            },
+            max_json_failed_checks=max_json_failed_checks,
+            max_csv_rows=max_csv_rows
+        )
 
     except Exception as e:
         st.error(f"❌ Error processing files: {str(e)}")
@@ -1067,14 +1067,11 @@ setTimeout(() => {
 // ============================================
 
 window.addEventListener("message", async (event) => {
-  const { type, data, fileName } = event.data;
+  const { type, buffer, fileName } = event.data;
   if (type === "loadIFC") {
     try {
-      const binaryString = atob(data);
-      const bytes = new Uint8Array(binaryString.length);
-      for (let i = 0; i < binaryString.length; i++) {
-        bytes[i] = binaryString.charCodeAt(i);
-      }
+      // The parent transfers the ArrayBuffer (zero-copy), no decoding needed here
+      const bytes = new Uint8Array(buffer as ArrayBuffer);
       await ifcLoader.load(bytes, true, fileName.replace(/\.(ifc|IFC)$/, ""));
       window.parent.postMessage({ type: "ifcLoaded", success: true }, "*");
     } catch (error) {
@@ -1086,4 +1083,27 @@ window.addEventListener("message", async (event) => {
 
 window.parent.postMessage({ type: "viewerReady" }, "*");
 
+// Direct load from URL (?modelUrl=...&fileName=...): the IFC is fetched from
+// Streamlit's static folder instead of being sent as base64 through postMessage
+const loadIfcFromUrl = async (modelUrl: string, fileName: string) => {
+  try {
+    const response = await fetch(modelUrl);
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status} fetching ${modelUrl}`);
+    }
+    const bytes = new Uint8Array(await response.arrayBuffer());
+    await ifcLoader.load(bytes, true, fileName.replace(/\.(ifc|IFC)$/, ""));
+    window.parent.postMessage({ type: "ifcLoaded", success: true }, "*");
+  } catch (error) {
+    console.error("Error loading IFC:", error);
+    window.parent.postMessage({ type: "ifcLoaded", success: false, error: String(error) }, "*");
+  }
+};
+
+const urlParams = new URLSearchParams(window.location.search);
+const modelUrl = urlParams.get("modelUrl");
+if (modelUrl) {
+  loadIfcFromUrl(modelUrl, urlParams.get("fileName") ?? "model.ifc");
+}
+
 console.log("IFC Viewer initialized successfully");